@@ -1,3 +1,32 @@
+from functools import lru_cache
+from itertools import accumulate
+
+# Punctuation marks that indicate natural breaks, as a tuple for str.endswith
+_BREAK_PUNCTUATION = (",", ";", ":", ".", "!", "?")
+
+# Articles, prepositions, conjunctions - don't break before these
+_DONT_BREAK_BEFORE = frozenset(
+    {
+        "the",
+        "a",
+        "an",
+        "of",
+        "in",
+        "on",
+        "at",
+        "to",
+        "for",
+        "and",
+        "or",
+        "but",
+        "with",
+        "from",
+        "by",
+    }
+)
+
+
+@lru_cache(maxsize=8192)
 def get_smart_title(
     node_content: str, max_words_per_line: int = 8, max_lines: int = 2
 ) -> str:
@@ -12,37 +41,39 @@ def get_smart_title(
     Returns:
         A formatted string with up to max_lines, each with ~max_words_per_line words
     """
-    # Clean and normalize the text
-    text = " ".join(node_content.strip().split())
+    # Split into words. At most max_lines * max_words_per_line words can be
+    # shown, so stop splitting there; any remainder stays as one final item,
+    # which keeps long texts from being split and normalized in full.
+    word_limit = max_words_per_line * max(max_lines, 1)
+    words = node_content.split(maxsplit=word_limit)
 
-    # Split into words
-    words = text.split()
-
-    # If content fits in one line, return as is
+    # If content fits in one line, return it with normalized whitespace
     if len(words) <= max_words_per_line:
-        return text
+        return " ".join(words)
+
+    # Join the displayable words once; lines are sliced out of this text using
+    # the offset at which each word starts
+    shown_words = words[:word_limit]
+    text = " ".join(shown_words)
+    offsets = list(accumulate((len(w) + 1 for w in shown_words), initial=0))
 
     lines = []
-    current_line_words = []
     word_idx = 0
 
     for line_num in range(max_lines):
         if word_idx >= len(words):
             break
 
-        # Collect words for this line
-        target_words = max_words_per_line
-        while word_idx < len(words) and len(current_line_words) < target_words:
-            current_line_words.append(words[word_idx])
-            word_idx += 1
+        line_words = words[word_idx : word_idx + max_words_per_line]
+        next_idx = word_idx + len(line_words)
 
         # If this is not the last line and there are more words, find a good break point
-        if line_num < max_lines - 1 and word_idx < len(words):
-            current_line_words = find_natural_break(current_line_words, words, word_idx)
-            word_idx = word_idx - (target_words - len(current_line_words))
+        if line_num < max_lines - 1 and next_idx < len(words):
+            line_words = line_words[: find_natural_break(line_words, words[next_idx])]
 
-        lines.append(" ".join(current_line_words))
-        current_line_words = []
+        line_end = word_idx + len(line_words)
+        lines.append(text[offsets[word_idx] : offsets[line_end] - 1])
+        word_idx = line_end
 
     # Add ellipsis if there's more content
     if word_idx < len(words):
@@ -51,53 +82,29 @@ def get_smart_title(
     return "\n".join(lines)
 
 
-def find_natural_break(current_words: list, all_words: list, next_idx: int) -> list:
+def find_natural_break(current_words: list, next_word: str) -> int:
     """
     Find a natural breaking point by looking for punctuation or complete phrases.
-    """
-    if not current_words:
-        return current_words
 
-    # Look for punctuation marks that indicate natural breaks
-    break_punctuation = {",", ";", ":", ".", "!", "?"}
+    Returns the number of words from current_words to keep on the line.
+    """
+    word_count = len(current_words)
+    if not word_count:
+        return word_count
 
     # Check last few words for punctuation
-    for i in range(len(current_words) - 1, max(0, len(current_words) - 4), -1):
-        word = current_words[i]
+    for i in range(word_count - 1, max(0, word_count - 4), -1):
         # If word ends with break punctuation, break after it
-        if any(word.endswith(p) for p in break_punctuation):
-            return current_words[: i + 1]
+        if current_words[i].endswith(_BREAK_PUNCTUATION):
+            return i + 1
 
     # Check if breaking here would split a common phrase pattern
     # Look at next word to avoid breaking "the dog", "of the", etc.
-    if next_idx < len(all_words):
-        last_word = current_words[-1].lower().rstrip(".,;:!?")
-        next_word = all_words[next_idx].lower()
-
-        # Articles, prepositions, conjunctions - don't break before these
-        dont_break_before = {
-            "the",
-            "a",
-            "an",
-            "of",
-            "in",
-            "on",
-            "at",
-            "to",
-            "for",
-            "and",
-            "or",
-            "but",
-            "with",
-            "from",
-            "by",
-        }
-
-        # If next word is in the list, remove last word to avoid breaking
-        if next_word in dont_break_before and len(current_words) > 3:
-            return current_words[:-1]
-
-    return current_words
+    # If next word is in the list, remove last word to avoid breaking
+    if next_word.lower() in _DONT_BREAK_BEFORE and word_count > 3:
+        return word_count - 1
+
+    return word_count
 
 
 # Example usage and tests
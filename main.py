@@ -1,9 +1,11 @@
-import json
+import hashlib
+import mmap
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import tempfile
 import os
 
+import orjson
 import streamlit as st
 import streamlit.components.v1 as components
 from pyvis.network import Network
@@ -12,40 +14,148 @@ from data_models import Graph
 from get_smart_title import get_smart_title
 
 
+def parse_event_graph_at(mm: mmap.mmap, pos: int, event_type: str) -> Optional[dict]:
+    """
+    Parse the JSONL line containing byte offset ``pos`` and return its graph data.
+
+    Returns None unless the line is a well-formed ``event_type`` event whose
+    graph data is a non-empty object, so the caller can fall back to a full scan.
+    """
+    start = mm.rfind(b"\n", 0, pos) + 1
+    end = mm.find(b"\n", pos)
+    if end < 0:
+        end = len(mm)
+
+    try:
+        event = orjson.loads(mm[start:end])
+    except orjson.JSONDecodeError:
+        return None
+
+    if not isinstance(event, dict) or event.get("event") != event_type:
+        return None
+
+    data = event.get("data", {})
+    if not isinstance(data, dict):
+        return None
+
+    graph_data = data.get("graph")
+    if not graph_data or not isinstance(graph_data, dict):
+        return None
+
+    return graph_data
+
+
 def load_graph_from_jsonl(jsonl_path: str) -> Optional[Graph]:
     """
     Load the final graph from a JSONL log file.
 
     Looks for SystemFinishEvent first, then falls back to the last GraphMergeEvent.
+    Only the selected event's line is parsed when possible, and only its graph
+    data is validated into a Graph. Malformed lines are only counted, and
+    reported with a warning, when that fast path fails and every line is
+    scanned; other lines are never read on the fast path.
     """
-    graph = None
-
-    with open(jsonl_path, "r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-
-            try:
-                event = json.loads(line)
-                event_type = event.get("event")
-                data = event.get("data", {})
+    final_data = None
+    malformed_lines = 0
+
+    with open(jsonl_path, "rb") as f:
+        # mmap cannot map an empty file
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Fast path: find the relevant event by its marker and parse only
+            # that line. Any SystemFinishEvent takes precedence, so the last
+            # GraphMergeEvent is only looked up when there is none.
+            finish_pos = mm.find(b'"SystemFinishEvent"')
+            if finish_pos >= 0:
+                final_data = parse_event_graph_at(mm, finish_pos, "SystemFinishEvent")
+            else:
+                merge_pos = mm.rfind(b'"GraphMergeEvent"')
+                if merge_pos < 0:
+                    # Neither event appears anywhere in the file
+                    return None
+                final_data = parse_event_graph_at(mm, merge_pos, "GraphMergeEvent")
+
+            # Fall back to scanning every line, e.g. when the marker line has
+            # no graph data or the marker text came from another event
+            if final_data is None:
+                for line in iter(mm.readline, b""):
+                    line = line.strip()
+                    if not line:
+                        continue
+
+                    # Events are JSON objects; skip anything else without parsing
+                    if not line.startswith(b"{"):
+                        malformed_lines += 1
+                        continue
+
+                    try:
+                        event = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        malformed_lines += 1
+                        continue
+
+                    event_type = event.get("event")
+                    data = event.get("data", {})
+                    if not isinstance(data, dict):
+                        malformed_lines += 1
+                        continue
+
+                    if event_type == "SystemFinishEvent":
+                        graph_data = data.get("graph", {})
+                        if graph_data:
+                            # A graph payload that is not an object is malformed
+                            if not isinstance(graph_data, dict):
+                                malformed_lines += 1
+                                continue
+                            final_data = graph_data
+                            break
+
+                    elif event_type == "GraphMergeEvent":
+                        graph_data = data.get("graph", {})
+                        if graph_data:
+                            if not isinstance(graph_data, dict):
+                                malformed_lines += 1
+                                continue
+                            final_data = graph_data
+
+    # Only set by the full-scan fallback
+    if malformed_lines:
+        st.warning(f"Skipped {malformed_lines} malformed line(s)")
+
+    if final_data is None:
+        return None
+
+    # Validate once; model_construct would leave nested nodes/references as dicts
+    return Graph.model_validate(final_data)
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def load_graph_cached(_jsonl_path: str, file_key: str) -> Optional[Graph]:
+    """
+    Cached wrapper around load_graph_from_jsonl.
 
-                if event_type == "SystemFinishEvent":
-                    graph_data = data.get("graph", {})
-                    if graph_data:
-                        graph = Graph(**graph_data)
-                        break
+    The path is left out of the cache key (leading underscore); ``file_key``
+    identifies the file contents (a content hash for uploads, path and mtime
+    for example files), so reruns triggered by the sidebar widgets reuse the
+    parsed graph instead of re-reading the JSONL.
+    """
+    return load_graph_from_jsonl(_jsonl_path)
 
-                elif event_type == "GraphMergeEvent":
-                    graph_data = data.get("graph", {})
-                    if graph_data:
-                        graph = Graph(**graph_data)
 
-            except (json.JSONDecodeError, KeyError, TypeError) as e:
-                st.warning(f"Skipping malformed line: {e}")
-                continue
+@st.cache_data(ttl=60, show_spinner=False)
+def list_example_files(example_dir: str) -> List[str]:
+    """List the .jsonl files in the example directory, sorted by name."""
+    path = Path(example_dir)
+    if not path.is_dir():
+        return []
 
-    return graph
+    return [
+        p.name
+        for p in sorted(path.iterdir())
+        if p.is_file() and p.suffix.lower() == ".jsonl"
+    ]
 
 
 def calculate_node_levels(graph: Graph) -> Dict[str, int]:
@@ -57,37 +167,49 @@ def calculate_node_levels(graph: Graph) -> Dict[str, int]:
     Returns:
         Dictionary mapping node_id to its level
     """
-    levels = {}
-
-    def get_level(node_id: str) -> int:
-        """Recursively calculate the level of a node."""
-        if node_id in levels:
-            return levels[node_id]
-
-        if node_id not in graph.nodes:
-            return 0
-
-        node = graph.nodes[node_id]
-        if not node.premises:
-            # Root node
-            levels[node_id] = 0
-            return 0
-
-        # Level is max of all parent levels + 1
-        parent_levels = [get_level(pid) for pid in node.premises if pid in graph.nodes]
-        if parent_levels:
-            level = max(parent_levels) + 1
-        else:
-            level = 0
-
-        levels[node_id] = level
-        return level
+    # Work on consecutive integer indices so the propagation loop only
+    # touches lists instead of hashing node ids
+    nodes = graph.nodes
+    index = {node_id: i for i, node_id in enumerate(nodes)}
+    levels = [0] * len(index)
+    indegree = [0] * len(index)
+    children: List[List[int]] = [[] for _ in index]
+
+    # Build the child adjacency and indegrees in a single pass over premises
+    for i, node in enumerate(nodes.values()):
+        for pid in node.premises:
+            parent = index.get(pid)
+            if parent is not None:
+                children[parent].append(i)
+                indegree[i] += 1
+
+    # Kahn's algorithm: start from root nodes and propagate max(parent) + 1.
+    # The queue list only grows, so iterating over it visits nodes in FIFO order.
+    queue = [i for i, degree in enumerate(indegree) if not degree]
+    for parent in queue:
+        child_level = levels[parent] + 1
+        for child in children[parent]:
+            if child_level > levels[child]:
+                levels[child] = child_level
+            indegree[child] -= 1
+            if not indegree[child]:
+                queue.append(child)
+
+    return dict(zip(nodes, levels))
+
+
+def _quick_title(text: str, limit: int = 80) -> str:
+    """
+    Short one-line title for reference statements in tooltips.
 
-    # Calculate levels for all nodes
-    for node_id in graph.nodes:
-        get_level(node_id)
+    Statements up to ``limit`` characters (after collapsing whitespace) are shown
+    in full; longer ones are truncated with get_smart_title.
+    """
+    text = " ".join(text.split())
+    if len(text) <= limit:
+        return text
 
-    return levels
+    return get_smart_title(text, max_words_per_line=10, max_lines=1)
 
 
 def create_pyvis_network(
@@ -127,8 +249,16 @@ def create_pyvis_network(
     else:
         net.toggle_physics(False)
 
-    # Find root nodes (nodes with no premises)
-    root_nodes = {node_id for node_id, node in graph.nodes.items() if not node.premises}
+    nodes = graph.nodes
+    references = graph.references
+
+    # Single pass over the nodes: premises that exist in the graph
+    valid_premises: Dict[str, list] = {}
+    for node_id, node in nodes.items():
+        valid_premises[node_id] = [pid for pid in node.premises if pid in nodes]
+
+    net_add_node = net.add_node
+    net_add_edge = net.add_edge
 
     # Color scheme
     normal_color = "#ADD8E6"  # lightblue
@@ -136,12 +266,12 @@ def create_pyvis_network(
     root_color = "#90EE90"  # lightgreen
 
     # Add nodes
-    for node_id, node in graph.nodes.items():
+    for node_id, node in nodes.items():
         # Determine node color
         if node.is_refutation:
             color = refutation_color
             border_color = "#DC143C"  # crimson
-        elif node_id in root_nodes:
+        elif not node.premises:  # root node
             color = root_color
             border_color = "#228B22"  # forestgreen
         else:
@@ -155,38 +285,52 @@ def create_pyvis_network(
         #     label += f"\n[{len(node.references)} ref{'s' if len(node.references) > 1 else ''}]"
 
         # Create tooltip with full information including references
-        tooltip = f"ID: {node.id}\n\nConclusion: {get_smart_title(node.conclusion, max_words_per_line=12, max_lines=8)}\n\nJustification: {get_smart_title(node.justification, max_words_per_line=12, max_lines=8)}"
+        tooltip_parts = [
+            f"ID: {node.id}",
+            "",
+            f"Conclusion: {get_smart_title(node.conclusion, max_words_per_line=12, max_lines=8)}",
+            "",
+            f"Justification: {get_smart_title(node.justification, max_words_per_line=12, max_lines=8)}",
+        ]
 
         # Add reference details to tooltip
-        if node.references:
-            tooltip += f"\n\n--- References ({len(node.references)}) ---"
+        ref_count = len(node.references)
+        if ref_count:
+            tooltip_parts += ["", f"--- References ({ref_count}) ---"]
             for ref_id in node.references:
-                if ref_id in graph.references:
-                    ref = graph.references[ref_id]
-                    # tooltip += f"\n\n[{ref_id[:8]}...]"
-                    # tooltip += f"\nTitle: {ref.source_citation.title}"
-                    # tooltip += f"\n**Authors:** {', '.join(ref.source_citation.authors)}"
-                    # tooltip += f"\nStatement: {get_smart_title(ref.statement, max_words_per_line=8, max_lines=100)}"
+                if ref_id in references:
+                    ref = references[ref_id]
+                    # tooltip_parts += ["", f"[{ref_id[:8]}...]"]
+                    # tooltip_parts.append(f"Title: {ref.source_citation.title}")
+                    # tooltip_parts.append(f"**Authors:** {', '.join(ref.source_citation.authors)}")
+                    # tooltip_parts.append(f"Statement: {get_smart_title(ref.statement, max_words_per_line=8, max_lines=100)}")
                     # if ref.context:
-                    #     tooltip += f"\nContext: {get_smart_title(ref.context, max_words_per_line=8, max_lines=100)}"
-                    tooltip += f"\n\n[{ref_id[:8]}] "
-                    tooltip += f"{ref.source_citation.title}"
-                    if len(ref.source_citation.authors) >= 2:
-                        tooltip += f" (by {', '.join(ref.source_citation.authors[:-1])} et al.)"
-                    elif len(ref.source_citation.authors) == 1:
-                        tooltip += f" (by {ref.source_citation.authors[0]})"
-                    tooltip += f"\n{get_smart_title(ref.statement, max_words_per_line=10, max_lines=1)}"
+                    #     tooltip_parts.append(f"Context: {get_smart_title(ref.context, max_words_per_line=8, max_lines=100)}")
+                    authors = ref.source_citation.authors
+                    if len(authors) >= 2:
+                        by = f" (by {', '.join(authors[:-1])} et al.)"
+                    elif len(authors) == 1:
+                        by = f" (by {authors[0]})"
+                    else:
+                        by = ""
+                    tooltip_parts += [
+                        "",
+                        f"[{ref_id[:8]}] {ref.source_citation.title}{by}",
+                        _quick_title(ref.statement),
+                    ]
 
         if node.is_refutation:
-            tooltip += "\n\n[REFUTATION]"
+            tooltip_parts += ["", "[REFUTATION]"]
+
+        tooltip = "\n".join(tooltip_parts)
 
         # Calculate node size based on number of references
-        size = node_size + (len(node.references) * 100)
+        size = node_size + (ref_count * 100)
 
         # Get the level for this node (for hierarchical layout)
         level = node_levels.get(node_id, 0)
 
-        net.add_node(
+        net_add_node(
             node_id,
             label=label,
             title=tooltip,
@@ -201,37 +345,40 @@ def create_pyvis_network(
         )
 
     # Add edges (premise relationships)
-    for node_id, node in graph.nodes.items():
-        for premise_id in node.premises:
-            if premise_id in graph.nodes:
-                net.add_edge(
-                    premise_id,
-                    node_id,
-                    color={"color": "#666666"},
-                    width=2,
-                    arrows="to",
-                )
-            # else:
-            #     # Premise not found - add as a warning node
-            #     net.add_node(
-            #         premise_id,
-            #         label=f"{premise_id}\n[MISSING]",
-            #         color='#FFFF00',  # yellow
-            #         size=node_size,
-            #         shape='box',
-            #         borderWidth=2,
-            #         borderWidthSelected=4,
-            #         border='#FF0000',  # red
-            #         font={'color': '#FF0000'}
-            #     )
-            #     net.add_edge(
-            #         premise_id,
-            #         node_id,
-            #         color={'color': '#FF0000'},
-            #         width=2,
-            #         style='dashed',
-            #         arrows='to'
-            #     )
+    for node_id, premise_ids in valid_premises.items():
+        for premise_id in premise_ids:
+            net_add_edge(
+                premise_id,
+                node_id,
+                color={"color": "#666666"},
+                width=2,
+                arrows="to",
+            )
+
+    # Premises missing from the graph are skipped above. To show them instead:
+    # for node_id, node in nodes.items():
+    #     for premise_id in node.premises:
+    #         if premise_id not in nodes:
+    #             # Premise not found - add as a warning node
+    #             net_add_node(
+    #                 premise_id,
+    #                 label=f"{premise_id}\n[MISSING]",
+    #                 color='#FFFF00',  # yellow
+    #                 size=node_size,
+    #                 shape='box',
+    #                 borderWidth=2,
+    #                 borderWidthSelected=4,
+    #                 border='#FF0000',  # red
+    #                 font={'color': '#FF0000'}
+    #             )
+    #             net_add_edge(
+    #                 premise_id,
+    #                 node_id,
+    #                 color={'color': '#FF0000'},
+    #                 width=2,
+    #                 style='dashed',
+    #                 arrows='to'
+    #             )
 
     # Set options for better visualization with hierarchical layout
     net.set_options("""
@@ -293,6 +440,28 @@ def create_pyvis_network(
     return net
 
 
+# Stand-in for the graph height in cached HTML; substituted on every rerun so
+# moving the height slider does not invalidate the cache
+_HEIGHT_PLACEHOLDER = "__GRAPH_HEIGHT__"
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def render_network_html(
+    _graph: Graph, graph_key: str, physics: bool, node_size: int
+) -> str:
+    """
+    Render the Pyvis network for a graph to HTML.
+
+    The graph is left out of the cache key (leading underscore); ``graph_key``
+    identifies it, using the same key the graph was loaded with. The height is
+    left as a placeholder for the caller to fill in.
+    """
+    net = create_pyvis_network(
+        _graph, height=_HEIGHT_PLACEHOLDER, physics=physics, node_size=node_size
+    )
+    return net.generate_html()
+
+
 def main():
     """Main Streamlit app entry point."""
     st.set_page_config(
@@ -319,12 +488,7 @@ def main():
 
         # Directory containing example files (relative to this script)
         example_dir = Path(__file__).parent / "example-graphs"
-        example_options = ["(none)"]
-        if example_dir.exists() and example_dir.is_dir():
-            # List only .jsonl files
-            for p in sorted(example_dir.iterdir()):
-                if p.is_file() and p.suffix.lower() == ".jsonl":
-                    example_options.append(p.name)
+        example_options = ["(none)"] + list_example_files(str(example_dir))
 
         selected_example = st.selectbox(
             "Choose an example JSONL file",
@@ -338,23 +502,27 @@ def main():
         if uploaded_file is not None:
             # Save uploaded file to temp location
             with tempfile.NamedTemporaryFile(
-                delete=False, suffix=".jsonl", mode="w"
+                delete=False, suffix=".jsonl", mode="wb"
             ) as tmp_file:
-                tmp_file.write(uploaded_file.getvalue().decode("utf-8"))
+                tmp_file.write(uploaded_file.getbuffer())
                 tmp_path = tmp_file.name
             file_to_load = tmp_path
+            file_key = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
             file_source = "uploaded"
         elif selected_example and selected_example != "(none)":
             # Use the selected example file from the example-graphs folder
             candidate = example_dir / selected_example
             if candidate.exists():
                 file_to_load = str(candidate)
+                file_key = f"{candidate}:{candidate.stat().st_mtime_ns}"
                 file_source = "example"
             else:
                 file_to_load = None
+                file_key = None
                 file_source = None
         else:
             file_to_load = None
+            file_key = None
             file_source = None
 
         st.markdown("---")
@@ -381,7 +549,7 @@ def main():
     # Load graph
     with st.spinner(f"Loading graph from {file_source} file..."):
         try:
-            graph = load_graph_from_jsonl(file_to_load)
+            graph = load_graph_cached(file_to_load, file_key)
             # Clean up temp file immediately after loading if it was uploaded
             if file_source == "uploaded" and tmp_path and os.path.exists(tmp_path):
                 try:
@@ -420,12 +588,8 @@ def main():
     st.info("💡 Tip: Drag nodes, scroll to zoom, and hover for detailed information!")
 
     with st.spinner("Generating visualization..."):
-        net = create_pyvis_network(
-            graph, height=f"{height}px", physics=physics, node_size=node_size
-        )
-
-        # Generate HTML and display
-        html = net.generate_html()
+        html = render_network_html(graph, file_key, physics, node_size)
+        html = html.replace(_HEIGHT_PLACEHOLDER, f"{height}px")
         components.html(html, height=height + 50)
 
 